@@ -1,25 +1,138 @@
-import photosdl
+import os
 import time
 import sys, getopt
-from os import listdir, remove
-from os.path import isfile, join, exists
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from photocache import PhotoCache
+
+# photosdl (requests + synology_api), server (flask) and waitress are only
+# needed when the daemon actually starts, so main() imports them; importing
+# filesync stays cheap.
+
+ALBUM = "kitchen-dash"
+ADDITIONAL = ["thumbnail","resolution","orientation","video_convert","video_meta","address"]
+FULL_RESYNC_EVERY = 10
+MAX_BACKOFF_FACTOR = 16
+DOWNLOAD_BATCH = 32
+
+# One pool for the life of the process; spawning eight fresh threads per
+# iteration just to tear them down again was wasted work.
+_download_pool = ThreadPoolExecutor(max_workers=8)
+
+
+def sync_loop(phdl, cache, interval=300):
+    warmed = False
+    last_raw_items = None
+    last_seen = None
+    polls_since_full = 0
+    # Back off exponentially while the album is idle; any change resets the
+    # poll rate to the base interval.
+    current_interval = interval
+    while True:
+        try:
+            # Poll for items newer than the last seen timestamp and merge
+            # additively; every FULL_RESYNC_EVERY polls fetch the whole album
+            # to pick up removals and anything a delta missed.
+            full = last_seen is None or polls_since_full >= FULL_RESYNC_EVERY
+            if full:
+                items = phdl.get_album_items(ALBUM, additional=ADDITIONAL)
+                polls_since_full = 0
+            else:
+                items = phdl.get_album_items(ALBUM, additional=ADDITIONAL, since=last_seen)
+                polls_since_full += 1
+            raw_items = items['data']['list']
+
+            for item in raw_items:
+                item_time = item.get('time')
+                if item_time is not None and (last_seen is None or item_time > last_seen):
+                    last_seen = item_time
+
+            if full:
+                # Steady state: the album rarely changes, so skip the parse
+                # and index diff when the response is identical to the
+                # previous full poll.
+                if raw_items == last_raw_items:
+                    current_interval = min(current_interval * 2, interval * MAX_BACKOFF_FACTOR)
+                    time.sleep(current_interval)
+                    continue
+                last_raw_items = raw_items
+
+                parsed_items = phdl.parse_items(raw_items)
+
+                if len(parsed_items) < 5:
+                    print("Only %s pictures, skipping sync" % len(parsed_items))
+                    time.sleep(interval)
+                    continue
+
+                new_keys = cache.sync_index(parsed_items)
+            else:
+                if not raw_items:
+                    current_interval = min(current_interval * 2, interval * MAX_BACKOFF_FACTOR)
+                    time.sleep(current_interval)
+                    continue
+                parsed_items = phdl.parse_items(raw_items)
+                new_keys = cache.sync_index(parsed_items, full=False)
+
+            if not warmed:
+                # First round after a restart: photos persisted by the
+                # previous run are a disk read away, not a download.
+                new_keys -= cache.load_from_disk(parsed_items)
+                warmed = True
+
+            futures = {_download_pool.submit(phdl.download_bytes, cache_key=cache_key, unit_id=parsed_items[cache_key]): cache_key
+                       for cache_key in new_keys}
+            # Batch completed downloads into put_many so an iteration takes
+            # the cache lock a handful of times instead of once per photo;
+            # flushing every DOWNLOAD_BATCH keeps catch-up syncs from holding
+            # the whole album in flight.
+            batch = []
+            for future in as_completed(futures):
+                cache_key = futures[future]
+                try:
+                    batch.append((cache_key, future.result()))
+                except Exception as e:
+                    print("Failed to download %s: %s" % (cache_key, e))
+                if len(batch) >= DOWNLOAD_BATCH:
+                    cache.put_many(batch)
+                    batch = []
+            if batch:
+                cache.put_many(batch)
+
+            if new_keys:
+                current_interval = interval
+            else:
+                current_interval = min(current_interval * 2, interval * MAX_BACKOFF_FACTOR)
+        except Exception as e:
+            # Errors sleep the base interval so a transient outage is retried
+            # promptly rather than backed off.
+            print("Sync failed: %s" % e)
+            current_interval = interval
+        time.sleep(current_interval)
 
 
 def main(argv):
-    photo_dir = "./"
+    global photosdl
+    import photosdl
+    import threading
+    from waitress import serve
+    from server import create_app
+
     url = ''
     port = ''
     username = ''
     password = ''
+    cache_dir = None
+    server_port = 8080
+    interval = 300
 
     try:
-        opts, args = getopt.getopt(argv,"hu:p:U:P:d:",["username=","password=","url=","port=","directory="])
+        opts, args = getopt.getopt(argv,"hu:p:U:P:d:s:i:",["username=","password=","url=","port=","directory=","server-port=","interval="])
     except getopt.GetoptError:
-        print ('filesync.py -u <username> -p <password> -U <url> -P <port> -d <dir>')
+        print ('filesync.py -u <username> -p <password> -U <url> -P <port> -d <cache_dir> -s <server_port> -i <interval>')
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
-            print ('filesync.py -u <username> -p <password> -U <url> -P <port> -d <dir>')
+            print ('filesync.py -u <username> -p <password> -U <url> -P <port> -d <cache_dir> -s <server_port> -i <interval>')
             sys.exit()
         elif opt in ("-u", "--username"):
             username = arg
@@ -30,38 +143,21 @@ def main(argv):
         elif opt in ("-P", "--port"):
             port = arg
         elif opt in ("-d", "--directory"):
-            photo_dir = arg
-
-
-    current_files = [f for f in listdir(photo_dir) if isfile(join(photo_dir, f))]
-
-    phdl = photosdl.Photos(url, port, username, password, secure=True, cert_verify=True, dsm_version=7, debug=True, otp_code=None)
-    additional= ["thumbnail","resolution","orientation","video_convert","video_meta","address"]
-    items = phdl.get_album_items('kitchen-dash', additional=additional)
-
-    parsed_items = phdl.parse_items(items['data']['list'])
+            cache_dir = arg
+        elif opt in ("-s", "--server-port"):
+            server_port = int(arg)
+        elif opt in ("-i", "--interval"):
+            interval = int(arg)
 
-    if len(parsed_items) < 5:
-        print("Only %s pictures, exiting" % len(parsed_items))
-        return
-    
-    for cache_key, unit_id in parsed_items.items():
-        if "%s.jpg" % cache_key in current_files:
-            current_files.remove("%s.jpg" % cache_key)
-        else:
-            dl = phdl.download_item(cache_key=cache_key, unit_id=unit_id)
-            with open("%s%s.jpg" % (photo_dir,cache_key), "wb") as binary_file:
-                binary_file.write(dl.content)
+    phdl = photosdl.Photos(url, port, username, password, secure=True, cert_verify=True, dsm_version=7,
+                           debug=bool(os.environ.get("PHOTOS_DEBUG")), otp_code=None)
+    cache = PhotoCache(disk_dir=cache_dir)
 
-    for current_file in current_files:
-        if current_file[-4:] != ".jpg":
-            continue
-        filename = "%s%s" % (photo_dir,current_file)
+    sync_thread = threading.Thread(target=sync_loop, args=(phdl, cache, interval), daemon=True)
+    sync_thread.start()
 
-        if exists(filename):
-            remove(filename)
+    app = create_app(cache, phdl)
+    serve(app, host="0.0.0.0", port=server_port, threads=16)
 
 if __name__ == "__main__":
    main(sys.argv[1:])
-   while True:
-       time.sleep(1)
\ No newline at end of file
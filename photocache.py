@@ -0,0 +1,203 @@
+from __future__ import annotations
+from typing import Iterable, Optional
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Entry:
+    __slots__ = ('data', 'size', 'referenced')
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        # Record the size up front so eviction accounting never has to touch
+        # data again - len() on a cold multi-MB bytes object would page it
+        # back in just to throw it away.
+        self.size = len(data)
+        self.referenced = False
+
+
+class PhotoCache:
+    # Shared between the sync thread and the web server. _index tracks what the
+    # album currently contains (cache_key -> unit_id), _data holds downloaded
+    # jpeg bytes, capped at max_bytes.
+    #
+    # Eviction is CLOCK (second-chance) rather than strict LRU: get() only
+    # flips a referenced bit on the entry, which is safe under the GIL without
+    # taking the lock, so concurrent reads never serialize against each other.
+    # put() takes the lock and sweeps the clock hand over _ring, evicting the
+    # first entry whose referenced bit is clear and clearing bits it passes.
+    #
+    # _index is treated as immutable: sync_index builds a fresh dict and swaps
+    # the reference in one atomic store, so get_unit_id and all_keys read it
+    # without locking.
+
+    # With a disk_dir, every put is mirrored to disk off-thread and
+    # load_from_disk re-populates the in-memory layer after a restart, so a
+    # cold start costs local reads instead of re-downloading the album.
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, disk_dir: Optional[str] = None) -> None:
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_pool = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._index: dict[str, str] = {}
+        self._data: dict[str, _Entry] = {}
+        self._ring: list[str] = []
+        self._hand = 0
+        self._size = 0
+        self._keys_json = b'[]'
+
+    def sync_index(self, items: dict[str, str], full: bool = True) -> set[str]:
+        # A full sync replaces the index and drops photos that left the
+        # album; a delta sync (full=False) only merges additions, since a
+        # delta response says nothing about what disappeared.
+        with self._lock:
+            # Key-view subtraction yields the result set directly, without
+            # first materializing both key sets.
+            new_keys = items.keys() - self._index.keys()
+            if full:
+                removed_keys = self._index.keys() - items.keys()
+                for cache_key in removed_keys:
+                    self._drop(cache_key)
+                    if self.disk_dir is not None:
+                        self._disk_pool.submit(self._unlink_disk, cache_key)
+                self._index = dict(items)
+            else:
+                merged = dict(self._index)
+                merged.update(items)
+                self._index = merged
+            # Pre-render the /files/list payload once per sync instead of
+            # once per request.
+            self._keys_json = json.dumps(['%s.jpg' % k for k in self._index]).encode()
+            return new_keys
+
+    def _drop(self, cache_key: str) -> None:
+        # Caller holds the lock.
+        entry = self._data.pop(cache_key, None)
+        if entry is not None:
+            self._size -= entry.size
+            self._ring.remove(cache_key)
+            if self._ring:
+                self._hand %= len(self._ring)
+
+    def put(self, cache_key: str, data) -> None:
+        # Accepts ready bytes or an iterable of chunks (e.g. a streaming
+        # response's iter_content), which is drained outside the lock.
+        if not isinstance(data, (bytes, bytearray)):
+            data = b''.join(data)
+        elif isinstance(data, bytearray):
+            data = bytes(data)
+        with self._lock:
+            self._insert(cache_key, data)
+            self._evict()
+        if self.disk_dir is not None:
+            self._disk_pool.submit(self._write_disk, cache_key, data)
+
+    def put_many(self, items) -> None:
+        # Insert a batch of (cache_key, data) pairs under one lock
+        # acquisition, running the eviction sweep once at the end instead of
+        # per item.
+        staged = [(cache_key, data if isinstance(data, bytes) else
+                   (bytes(data) if isinstance(data, bytearray) else b''.join(data)))
+                  for cache_key, data in items]
+        with self._lock:
+            for cache_key, data in staged:
+                self._insert(cache_key, data)
+            self._evict()
+        if self.disk_dir is not None:
+            for cache_key, data in staged:
+                self._disk_pool.submit(self._write_disk, cache_key, data)
+
+    def _insert(self, cache_key: str, data: bytes) -> None:
+        # Caller holds the lock.
+        self._drop(cache_key)
+        new_entry = _Entry(data)
+        self._data[cache_key] = new_entry
+        self._ring.append(cache_key)
+        self._size += new_entry.size
+
+    def _evict(self) -> None:
+        # Caller holds the lock.
+        while self._size > self.max_bytes and self._ring:
+            self._hand %= len(self._ring)
+            victim = self._ring[self._hand]
+            entry = self._data[victim]
+            if entry.referenced:
+                entry.referenced = False
+                self._hand += 1
+            else:
+                self._ring.pop(self._hand)
+                del self._data[victim]
+                self._size -= entry.size
+
+    def load_from_disk(self, keys: Iterable[str]) -> set[str]:
+        # Re-populate the in-memory layer from disk_dir, stopping at the
+        # memory budget; returns the keys that were loaded.
+        loaded: set[str] = set()
+        if self.disk_dir is None:
+            return loaded
+        for cache_key in keys:
+            if self.contains(cache_key):
+                loaded.add(cache_key)
+                continue
+            try:
+                with open(self._disk_path(cache_key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            with self._lock:
+                if self._size + len(data) > self.max_bytes:
+                    break
+                self._insert(cache_key, data)
+            loaded.add(cache_key)
+        return loaded
+
+    def _disk_path(self, cache_key: str) -> str:
+        return os.path.join(self.disk_dir, '%s.jpg' % cache_key)
+
+    def _write_disk(self, cache_key: str, data: bytes) -> None:
+        try:
+            with open(self._disk_path(cache_key), 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            print("Failed to persist %s: %s" % (cache_key, e))
+
+    def _unlink_disk(self, cache_key: str) -> None:
+        try:
+            os.remove(self._disk_path(cache_key))
+        except OSError:
+            pass
+
+    def get(self, cache_key: str) -> Optional[bytes]:
+        # Lock-free hot path: a dict read plus an attribute store, both atomic
+        # under the GIL.
+        entry = self._data.get(cache_key)
+        if entry is None:
+            return None
+        entry.referenced = True
+        return entry.data
+
+    def contains(self, cache_key: str) -> bool:
+        return cache_key in self._data
+
+    def get_unit_id(self, cache_key: str) -> Optional[str]:
+        return self._index.get(cache_key)
+
+    def all_keys(self) -> tuple[str, ...]:
+        return tuple(self._index)
+
+    def keys_json(self) -> bytes:
+        return self._keys_json
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                'indexed': len(self._index),
+                'cached': len(self._data),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
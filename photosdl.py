@@ -1,8 +1,14 @@
 from __future__ import annotations
 from typing import Optional
 import json
+import requests
+from requests.adapters import HTTPAdapter
 from synology_api import photos
 
+# The album keyword and additional-fields list are constant across polls;
+# cache their JSON encodings instead of re-serializing every call.
+_PARAM_JSON_CACHE: dict[tuple, tuple[str, str]] = {}
+
 class Photos(photos.Photos):
 
     def __init__(self,
@@ -20,6 +26,41 @@ class Photos(photos.Photos):
         super(Photos, self).__init__(ip_address, port, username, password, secure, cert_verify,
                                      dsm_version, debug, otp_code)
 
+        # synology_api fires every call through module-level requests.get/post,
+        # so each one pays a fresh TCP+TLS handshake. Route our calls over one
+        # pooled keep-alive session instead.
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+        self._http.mount('https://', adapter)
+        self._http.mount('http://', adapter)
+        self._http.verify = self.session.verify_cert_enabled()
+        self.request_data = self._request_data
+
+    def _request_data(self, api_name: str, api_path: str, req_param: dict[str, object],
+                      method: Optional[str] = None, response_json: bool = True,
+                      stream: bool = False):
+        # Same wire format as Authentication.request_data, but on self._http.
+        for k, v in req_param.items():
+            if isinstance(v, bool):
+                req_param[k] = str(v).lower()
+
+        if method is None:
+            method = 'get'
+
+        req_param['_sid'] = self.session.sid
+        url = ('%s%s' % (self.session.base_url, api_path)) + '?api=' + api_name
+        headers = {'X-SYNO-TOKEN': self.session._syno_token}
+
+        if method == 'get':
+            response = self._http.get(url, params=req_param, headers=headers, stream=stream)
+        else:
+            response = self._http.post(url, data=req_param, headers=headers, stream=stream)
+
+        if response_json is True:
+            return response.json()
+        else:
+            return response
+
     # https://<IP_ADDRESS>/photo/webapi/entry.cgi?api=SYNO.Foto.Search.Search&method=list_item
     # &version=1&offset=0&limit=10&keyword=%22Iceland%22
 
@@ -28,25 +69,50 @@ class Photos(photos.Photos):
     #https://syn.michaelgoldstein.co:5001/webapi//photo/webapi/entry.cgi?api=SYNO.Foto.Search.Search
 
 
-    def get_album_items(self, album_name: str, additional: Optional[str | list[str]] = None) -> dict[str, object] | str:
+    def get_album_items(self, album_name: str, additional: Optional[str | list[str]] = None,
+                        since: Optional[int] = None) -> dict[str, object] | str:
         if additional is None:
             additional = []
         api_name = 'SYNO.Foto.Search.Search'
-        req_param = {'version': '6', 'keyword': json.dumps(album_name), 'offset': '0', 'limit': '500', 
+        memo_key = (album_name, tuple(additional))
+        try:
+            keyword_json, additional_json = _PARAM_JSON_CACHE[memo_key]
+        except KeyError:
+            keyword_json = json.dumps(album_name)
+            additional_json = json.dumps(additional)
+            _PARAM_JSON_CACHE[memo_key] = (keyword_json, additional_json)
+        req_param = {'version': '6', 'keyword': keyword_json, 'offset': '0', 'limit': '500',
                      'method': 'list_item',
-                     'additional': json.dumps(additional)}
-        
+                     'additional': additional_json}
+        if since is not None:
+            # Delta fetch: only items taken/modified after this timestamp.
+            req_param['start_time'] = str(since)
+
         return self.request_data(api_name, 'entry.cgi/SYNO.Foto.Search.Search', req_param, method='post')
     
     @staticmethod
     def parse_items(items: list[object]) -> dict[str,str]:
-        parsed_items = {}
-        for item in items:
-            parsed_items[item['additional']['thumbnail']['cache_key']] = item['additional']['thumbnail']['unit_id']
-        return parsed_items
+        return {(thumbnail := item['additional']['thumbnail'])['cache_key']: thumbnail['unit_id']
+                for item in items}
 
-    def download_item(self, cache_key: str, unit_id: str):
+    def download_item(self, cache_key: str, unit_id: str, stream: bool = False):
         api_name = 'SYNO.Foto.Download'
         req_param = {'version': '2', 'method': 'download', 'download_type': 'optimized_jpeg','cache_key': cache_key, 'unit_id': json.dumps([unit_id])}
-        return self.request_data(api_name, 'entry.cgi', req_param, method='get', response_json=False)
+        return self.request_data(api_name, 'entry.cgi', req_param, method='get', response_json=False, stream=stream)
+
+    def download_bytes(self, cache_key: str, unit_id: str) -> bytes:
+        # .content makes requests join all received chunks into one extra
+        # copy; stream into a buffer pre-sized from Content-Length instead.
+        response = self.download_item(cache_key=cache_key, unit_id=unit_id, stream=True)
+        length = int(response.headers.get('Content-Length', 0))
+        if not length:
+            return response.content
+        buf = bytearray(length)
+        offset = 0
+        for chunk in response.iter_content(65536):
+            buf[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        if offset < length:
+            del buf[offset:]
+        return bytes(buf)
 
@@ -0,0 +1,118 @@
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from flask import Flask, Response, abort, jsonify, request
+
+# Whenever a request misses the cache, warm a few more not-yet-cached photos
+# in the background: /files picks keys at random, so any uncached key is a
+# likely next miss.
+_prefetch_pool = ThreadPoolExecutor(max_workers=2)
+PREFETCH_COUNT = 5
+
+
+def _strip_ext(cache_key):
+    # /files/<key> accepts the filename form the list endpoint hands out.
+    if cache_key.endswith(".jpg"):
+        return cache_key[:-4]
+    return cache_key
+
+
+def create_app(cache, phdl):
+    app = Flask(__name__)
+    # Swappable so tests (or a future weighted picker) can replace the RNG
+    # by assignment instead of patching the random module.
+    app.config.setdefault("RNG_CHOICE", random.choice)
+    prefetching = set()
+    prefetching_lock = threading.Lock()
+    inflight = {}
+    inflight_lock = threading.Lock()
+
+    def _prefetch(cache_key):
+        try:
+            _fetch_and_cache(cache_key)
+        except Exception as e:
+            print("Prefetch of %s failed: %s" % (cache_key, e))
+        finally:
+            with prefetching_lock:
+                prefetching.discard(cache_key)
+
+    def _schedule_prefetch():
+        uncached = [k for k in cache.all_keys() if not cache.contains(k)]
+        for cache_key in random.sample(uncached, min(PREFETCH_COUNT, len(uncached))):
+            with prefetching_lock:
+                if cache_key in prefetching:
+                    continue
+                prefetching.add(cache_key)
+            _prefetch_pool.submit(_prefetch, cache_key)
+
+    def _fetch_and_cache(cache_key):
+        unit_id = cache.get_unit_id(cache_key)
+        if unit_id is None:
+            return None
+        # Coalesce concurrent misses for the same key: the first caller
+        # downloads, everyone else waits on its future.
+        with inflight_lock:
+            future = inflight.get(cache_key)
+            if future is None:
+                future = Future()
+                inflight[cache_key] = future
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            return future.result()
+        try:
+            data = phdl.download_bytes(cache_key=cache_key, unit_id=unit_id)
+            cache.put(cache_key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with inflight_lock:
+                del inflight[cache_key]
+
+    def _serve(cache_key):
+        # cache_key is content-addressed on the Synology side, so it doubles
+        # as a stable ETag: repeat views cost a 304 instead of the full jpeg.
+        if request.if_none_match.contains(cache_key):
+            return Response(status=304)
+        data = cache.get(cache_key)
+        if data is None:
+            data = _fetch_and_cache(cache_key)
+            if data is not None:
+                _schedule_prefetch()
+        if data is None:
+            abort(404)
+        # Hand the cached bytes straight to the Response; bytes are immutable,
+        # so no BytesIO wrapper or extra copy is needed.
+        response = Response(data, mimetype="image/jpeg", headers={
+            "Content-Disposition": 'inline; filename="%s.jpg"' % cache_key,
+            "Content-Length": str(len(data)),
+        })
+        response.set_etag(cache_key)
+        response.cache_control.max_age = 3600
+        return response
+
+    @app.route("/files")
+    def random_file():
+        keys = cache.all_keys()
+        if not keys:
+            abort(404)
+        return _serve(app.config["RNG_CHOICE"](keys))
+
+    @app.route("/files/list")
+    def list_files():
+        return Response(cache.keys_json(), mimetype="application/json")
+
+    @app.route("/files/<cache_key>")
+    def get_file(cache_key):
+        return _serve(_strip_ext(cache_key))
+
+    @app.route("/cache/stats")
+    def cache_stats():
+        return jsonify(cache.stats())
+
+    return app